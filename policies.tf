@@ -46,7 +46,7 @@ data "aws_iam_policy_document" "ecr_for_lambda" {
   }
   statement {
     effect    = "Allow"
-    actions   = ["ecr:DescribeImages"]
+    actions   = ["ecr:DescribeImages", "ecr:ListImages"]
     resources = ["*"]
   }
 }
@@ -15,33 +15,144 @@ ECR repositories, respectively, of the service account.
 
 import boto3
 import botocore
+import botocore.session
+import heapq
 import json
 import time
 import logging
 import os
+import random
 import re
+import threading
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Configuration shared by all clients, sized for the thread pools used to
+# call AWS concurrently
+CLIENT_CONFIG = Config(
+    max_pool_connections=32,
+    connect_timeout=3,
+    read_timeout=10,
+    retries={"max_attempts": 5, "mode": "standard"},
+)
+
+# Service-specific configuration of clients
+CLIENT_CONFIGS = {
+    "ecr": CLIENT_CONFIG.merge(
+        Config(retries={"max_attempts": 10, "mode": "adaptive"})
+    ),
+    "s3": CLIENT_CONFIG.merge(Config(max_pool_connections=64)),
+    "ssm": CLIENT_CONFIG.merge(
+        Config(retries={"max_attempts": 10, "mode": "adaptive"})
+    ),
+    "sts": CLIENT_CONFIG,
+}
+
+# Clients that use the execution role of the Lambda, kept across warm
+# invocations of the Lambda
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Error codes that are worth retrying when assuming a role, in addition to
+# the throttling errors retried by botocore. Access may be denied for a short
+# while after the role has been created or updated, as IAM is eventually
+# consistent.
+RETRYABLE_STS_ERROR_CODES = {"AccessDenied"}
+# The total time to spend retrying, which should be well below the timeout of
+# the Lambda (30 seconds by default)
+ASSUME_ROLE_MAX_RETRY_TIME_IN_SECONDS = 15
+ASSUME_ROLE_MAX_BACKOFF_IN_SECONDS = 5
+ASSUME_ROLE_DURATION_IN_SECONDS = 3600
+
+# Sessions for assumed roles, kept across warm invocations of the Lambda
+_assumed_role_sessions = {}
+
+# ECR repositories by name together with the time they were described, kept
+# across warm invocations of the Lambda
+_ecr_repositories = {}
+ECR_REPOSITORY_CACHE_TTL_IN_SECONDS = 60
+
+# SSM clients, kept across warm invocations of the Lambda
+_ssm_clients = {}
+
+# S3 key patterns of Lambda and frontend artifacts. The named group `sha1`
+# captures the version of the artifact.
+LAMBDA_KEY_PATTERNS = [re.compile(r"/(?P<sha1>[a-z0-9]{7,})\.(zip|jar)$")]
+FRONTEND_KEY_PATTERNS = [re.compile(r"/(?P<sha1>[a-z0-9]{7,})\.zip$")]
+# The format of a (possibly abbreviated) SHA1 that can be read from the key of
+# an artifact without looking up its metadata
+SHA1_PATTERN = re.compile(r"[0-9a-f]{7,40}")
+
+# The maximum number of images that can be described in one request to ECR
+ECR_DESCRIBE_IMAGES_BATCH_SIZE = 100
+
+# The number of S3 objects of an application to fetch metadata for
+# concurrently. Only the most recent object is fetched first, as it usually
+# has a matching set of tags.
+S3_METADATA_BATCH_SIZE = 8
+# Fetches S3 metadata for all applications, which bounds the total number of
+# concurrent HeadObject requests. Kept across warm invocations of the Lambda.
+_s3_metadata_executor = ThreadPoolExecutor(max_workers=16)
+
+# The maximum number of SSM parameters that can be fetched in one request
+SSM_GET_PARAMETERS_BATCH_SIZE = 10
+
+
+def get_client(service_name):
+    """Gets a client that uses the execution role of the Lambda.
+
+    The client is created on first use with the configuration in
+    `CLIENT_CONFIGS` (or `CLIENT_CONFIG`), and is kept across warm
+    invocations of the Lambda.
+
+    Args:
+        service_name: The name of the AWS service (e.g., `ecr`).
+
+    Returns:
+        A client for the service.
+    """
+    with _clients_lock:
+        if service_name not in _clients:
+            _clients[service_name] = boto3.client(
+                service_name,
+                config=CLIENT_CONFIGS.get(service_name, CLIENT_CONFIG),
+            )
+        return _clients[service_name]
+
 
 def assume_role(account_id, account_role):
-    sts_client = boto3.client("sts")
+    sts_client = get_client("sts")
     role_arn = f"arn:aws:iam::{account_id}:role/{account_role}"
-    assuming_role = True
-    retry_wait_in_seconds = 5
-    while assuming_role:
+    attempt = 0
+    start_time = time.monotonic()
+    while True:
         try:
             logger.info("Trying to assume role with arn '%s'", role_arn)
             assumedRoleObject = sts_client.assume_role(
-                RoleArn=role_arn, RoleSessionName="pipeline-set-version"
+                RoleArn=role_arn,
+                RoleSessionName="pipeline-set-version",
+                DurationSeconds=ASSUME_ROLE_DURATION_IN_SECONDS,
             )
-            assuming_role = False
-        except botocore.exceptions.ClientError:
-            assuming_role = True
+            break
+        except botocore.exceptions.ClientError as e:
             logger.exception("Failed to assume role with arn '%s'", role_arn)
+            attempt += 1
+            # Exponential backoff with full jitter
+            retry_wait_in_seconds = random.uniform(
+                0, min(ASSUME_ROLE_MAX_BACKOFF_IN_SECONDS, 2 ** attempt)
+            )
+            if (
+                e.response["Error"]["Code"] not in RETRYABLE_STS_ERROR_CODES
+                or time.monotonic() - start_time + retry_wait_in_seconds
+                > ASSUME_ROLE_MAX_RETRY_TIME_IN_SECONDS
+            ):
+                raise
             logger.info(
-                "Retrying role assumption for role with arn '%s' in %ss",
+                "Retrying role assumption for role with arn '%s' in %.2fs",
                 role_arn,
                 retry_wait_in_seconds,
             )
@@ -50,6 +161,161 @@ def assume_role(account_id, account_role):
     return assumedRoleObject["Credentials"]
 
 
+def get_assumed_role_session(account_id, account_role):
+    """Gets a session that uses the credentials of an assumed role.
+
+    The session is kept across warm invocations of the Lambda, and its
+    credentials are refreshed by assuming the role again shortly before they
+    expire.
+
+    Args:
+        account_id: The id of the account that owns the role.
+        account_role: The name of the role to assume.
+
+    Returns:
+        A boto3 session using the credentials of the assumed role.
+    """
+    role_arn = f"arn:aws:iam::{account_id}:role/{account_role}"
+    if role_arn not in _assumed_role_sessions:
+
+        def refresh():
+            credentials = assume_role(account_id, account_role)
+            return {
+                "access_key": credentials["AccessKeyId"],
+                "secret_key": credentials["SecretAccessKey"],
+                "token": credentials["SessionToken"],
+                "expiry_time": credentials["Expiration"].isoformat(),
+            }
+
+        credentials = RefreshableCredentials.create_from_metadata(
+            metadata=refresh(),
+            refresh_using=refresh,
+            method="sts-assume-role",
+        )
+        botocore_session = botocore.session.get_session()
+        botocore_session._credentials = credentials
+        _assumed_role_sessions[role_arn] = boto3.Session(
+            botocore_session=botocore_session
+        )
+    return _assumed_role_sessions[role_arn]
+
+
+def get_most_recent_image_tags(client, repository_name, tag_filters=[]):
+    """Gets the tags of the most recently pushed image in an ECR repository
+    that is tagged with a SHA1-tag and, optionally, at least one of a list of
+    tags.
+
+    The tags of all images are listed first, and the (larger) image details
+    are only described if more than one image matches, as the push date is
+    needed to tell them apart.
+
+    Args:
+        client: The ECR client to use.
+        repository_name: The name of the ECR repository.
+        tag_filters: An optional list of image tags to filter on.
+
+    Returns:
+        A list containing the tags of the most recent matching image, or
+        `None` if no image matches.
+    """
+    tag_filter_set = frozenset(tag_filters)
+    image_tags = {}
+    paginator = client.get_paginator("list_images")
+    for page in paginator.paginate(
+        repositoryName=repository_name, filter={"tagStatus": "TAGGED"}
+    ):
+        for image_id in page["imageIds"]:
+            image_tags.setdefault(image_id["imageDigest"], set()).add(
+                image_id["imageTag"]
+            )
+    matching_digests = [
+        digest
+        for digest, tags in image_tags.items()
+        if any(tag.endswith("-SHA1") for tag in tags)
+        and (len(tag_filter_set) == 0 or not tag_filter_set.isdisjoint(tags))
+    ]
+    if len(matching_digests) == 0:
+        return None
+    if len(matching_digests) == 1:
+        return list(image_tags[matching_digests[0]])
+
+    image_ids = [{"imageDigest": digest} for digest in matching_digests]
+    batches = [
+        image_ids[i : i + ECR_DESCRIBE_IMAGES_BATCH_SIZE]
+        for i in range(0, len(image_ids), ECR_DESCRIBE_IMAGES_BATCH_SIZE)
+    ]
+    most_recent_image = None
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for images in executor.map(
+            lambda batch: client.describe_images(
+                repositoryName=repository_name, imageIds=batch
+            )["imageDetails"],
+            batches,
+        ):
+            for image in images:
+                if (
+                    most_recent_image is None
+                    or image["imagePushedAt"]
+                    > most_recent_image["imagePushedAt"]
+                ):
+                    most_recent_image = image
+    return most_recent_image["imageTags"] if most_recent_image else None
+
+
+def get_ecr_repository_version(client, repo, app):
+    """Gets the latest image version of a single ECR repository.
+
+    Args:
+        client: The ECR client to use.
+        repo: The repository as returned by `describe_repositories`.
+        app: The dictionary describing the application (e.g., { "name": "my-ecr-repo", "tag_filters": ["master-branch"]}).
+
+    Returns:
+        A tuple containing the name of the repository and its version, or
+        `None` if no suitable image was found.
+    """
+    name = repo["repositoryName"]
+    image_tag_filters = app.get("tag_filters", [])
+    try:
+        most_recent_image_tags = get_most_recent_image_tags(
+            client, name, image_tag_filters
+        )
+    except client.exceptions.ImageNotFoundException:
+        most_recent_image_tags = None
+    if most_recent_image_tags is None:
+        logger.warn(
+            "Could not find an image in repository '%s' tagged with both a SHA1 and the tags '%s'",
+            name,
+            ", ".join(image_tag_filters),
+        )
+        return None
+    most_recent_image_sha1_tags = (
+        t[: -len("-SHA1")]
+        for t in most_recent_image_tags
+        if t.endswith("-SHA1")
+    )
+    most_recent_sha1 = next(most_recent_image_sha1_tags)
+    if next(most_recent_image_sha1_tags, None) is not None:
+        logger.warn(
+            "Expected to find an image in repository '%s' with one SHA1-tag, but found multiple such tags",
+            name,
+        )
+        return None
+    logger.info(
+        "Most recent image in repository '%s' has SHA1 '%s'",
+        name,
+        most_recent_sha1,
+    )
+    return (
+        name,
+        {
+            "version": most_recent_sha1,
+            "location": repo["repositoryUri"].split("/")[0],  # Registry URI
+            "path": repo["repositoryName"],
+        },
+    )
+
+
 def get_ecr_versions(applications):
     """Gets the latest image version of all ECR repositories in the current account.
 
@@ -65,130 +331,244 @@ def get_ecr_versions(applications):
         latest image version in each repository.
     """
 
-    client = boto3.client("ecr")
-    repositories = client.describe_repositories()["repositories"]
-    if len(repositories):
-        repositories = list(
-            filter(
-                lambda r: r["repositoryName"]
-                in list(map(lambda app: app["name"], applications)),
-                repositories,
-            )
-        )
+    client = get_client("ecr")
+    applications_by_name = {}
+    for app in applications:
+        applications_by_name.setdefault(app["name"], app)
+    now = time.time()
+    repositories = [
+        _ecr_repositories[name][1]
+        for name in applications_by_name
+        if name in _ecr_repositories
+        and now - _ecr_repositories[name][0]
+        < ECR_REPOSITORY_CACHE_TTL_IN_SECONDS
+    ]
+    missing_names = set(applications_by_name) - {
+        r["repositoryName"] for r in repositories
+    }
+    if len(missing_names):
+        paginator = client.get_paginator("describe_repositories")
+        for page in paginator.paginate(PaginationConfig={"PageSize": 100}):
+            for r in page["repositories"]:
+                if r["repositoryName"] in missing_names:
+                    missing_names.remove(r["repositoryName"])
+                    repositories.append(r)
+                    _ecr_repositories[r["repositoryName"]] = (now, r)
+            if len(missing_names) == 0:
+                # All requested repositories found -- no need to list the rest
+                break
     logger.debug("Found %s ECR repositories", len(repositories))
     versions = {}
-    for repo in repositories:
-        name = repo["repositoryName"]
-        app = next((app for app in applications if app["name"] == name), None)
-        if app is None:
-            logger.error(
-                "No repository with name '%s' found in input list", name
-            )
-            continue
-        image_tag_filters = app.get("tag_filters", [])
-        # Only tagged images
-        try:
-            filter_kwargs = {}
-            if len(image_tag_filters):
-                filter_kwargs = {
-                    "imageIds": [
-                        {"imageTag": image_tag}
-                        for image_tag in image_tag_filters
-                    ]
-                }
-            images = client.describe_images(
-                repositoryName=name,
-                filter={"tagStatus": "TAGGED"},
-                **filter_kwargs,
-            )["imageDetails"]
-        except client.exceptions.ImageNotFoundException:
-            logger.warn(
-                "No (matching) images found in ECR repo '%s' -- the repository is either empty, or does not contain any images tagged with '%s'",
-                name,
-                ", ".join(image_tag_filters),
-            )
-            continue
-        # Only keep images ttagged with a SHA1-tag
-        filtered_images = list(
-            filter(
-                lambda image: any(
-                    t.endswith("-SHA1") for t in image["imageTags"]
-                ),
-                images,
-            )
-        )
-        if len(filtered_images) == 0:
-            logger.warn(
-                "Could not find an image in repository '%s' tagged with both a SHA1 and the tags '%s'",
-                name,
-                ", ".join(image_tag_filters),
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        futures = [
+            executor.submit(
+                get_ecr_repository_version,
+                client,
+                repo,
+                applications_by_name[repo["repositoryName"]],
             )
-            continue
-        # Sort the images by date
-        sorted_images = sorted(
-            filtered_images, key=lambda image: image["imagePushedAt"]
-        )
-        most_recent_image = sorted_images[-1]
-        most_recent_image_sha1_tags = [
-            t.split("-SHA1")[0]
-            for t in most_recent_image["imageTags"]
-            if t.endswith("-SHA1")
+            for repo in repositories
         ]
-        if len(most_recent_image_sha1_tags) > 1:
-            logger.warn(
-                "Expected to find an image in repository '%s' with one SHA1-tag, but found multiple such tags",
-                name,
-            )
-            continue
-        most_recent_sha1 = most_recent_image_sha1_tags[0]
-        logger.info(
-            "Most recent image in repository '%s' has SHA1 '%s'",
-            name,
-            most_recent_sha1,
-        )
-        versions[name] = {
-            "version": most_recent_sha1,
-            "location": repo["repositoryUri"].split("/")[0],  # Registry URI
-            "path": repo["repositoryName"]
-        }
+        for future in as_completed(futures):
+            result = future.result()
+            if result is not None:
+                name, version = result
+                versions[name] = version
 
     logger.info("Found ECR versions '%s'", versions)
     return versions
 
 
-def update_parameterstore(credentials, name, value, region):
+def update_parameterstore(ssm, name, value):
     """Updates (or creates) one parameter in parameter store.
 
     Args:
-        credentials: The credentials to use when creating the SSM client.
+        ssm: The SSM client to use.
         name: The name of the parameter.
         value: The value of the parameter.
-        region: The region to use when creating the SSM client.
     """
-    if credentials is None:
-        ssm = boto3.client("ssm", region_name=region)
-    else:
-        ssm = boto3.client(
-            "ssm",
-            aws_access_key_id=credentials["AccessKeyId"],
-            aws_secret_access_key=credentials["SecretAccessKey"],
-            aws_session_token=credentials["SessionToken"],
-            region_name=region,
-        )
     logger.info(
         "Setting SSM parameter '%s' to '%s' in region '%s'",
         name,
         value,
-        region,
+        ssm.meta.region_name,
     )
     ssm.put_parameter(Name=name, Value=value, Type="String", Overwrite=True)
 
 
+def get_version_from_metadata(metadata, tag_filters):
+    """Gets the version of an S3 artifact from its user-defined metadata.
+
+    Args:
+        metadata: The user-defined S3 metadata of the artifact.
+        tag_filters: A list of tags that must all be present in the `tags`
+            metadata of the artifact.
+
+    Returns:
+        The SHA1 of the artifact, or `None` if the artifact does not have a
+        SHA1-tag and all the tags in `tag_filters`.
+    """
+    raw_tags = metadata.get("tags", None)
+    # Cheap checks on the raw JSON string to skip parsing it for artifacts
+    # that cannot match
+    if (
+        not raw_tags
+        or '-SHA1"' not in raw_tags
+        or not all(json.dumps(tag) in raw_tags for tag in tag_filters)
+    ):
+        return None
+    tags = json.loads(raw_tags)
+    if (
+        tags
+        and any(tag.endswith("-SHA1") for tag in tags)
+        and all(tag in tags for tag in tag_filters)
+    ):
+        return next(
+            (tag[: -len("-SHA1")] for tag in tags if tag.endswith("-SHA1")),
+            None,
+        )
+    return None
+
+
+def get_version_from_key(key, allowed_key_patterns):
+    """Gets the version of an S3 artifact from its key.
+
+    Args:
+        key: The S3 key of the artifact.
+        allowed_key_patterns: Compiled S3 key patterns for application
+            artifacts. Patterns containing a named group `sha1` are used to
+            extract the version (e.g., `(?P<sha1>[a-z0-9]{7,})`).
+
+    Returns:
+        The SHA1 of the artifact, or `None` if none of the patterns capture
+        a hexadecimal SHA1 from the key (e.g., `package` or `release`).
+    """
+    for pattern in allowed_key_patterns:
+        match = pattern.search(key)
+        if (
+            match
+            and match.groupdict().get("sha1")
+            and SHA1_PATTERN.fullmatch(match.group("sha1"))
+        ):
+            return match.group("sha1")
+    return None
+
+
+def get_s3_artifact_version(
+    s3, application, bucket_name, s3_prefix, allowed_key_patterns
+):
+    """Gets the S3 version of a single application artifact.
+
+    Args:
+        s3: The S3 client to use.
+        application: The dictionary describing the application (e.g., { "name": "my-s3-artifact", "tag_filters": ["master-branch"]}).
+        bucket_name: The name of the S3 bucket to use when looking for application artifacts.
+        s3_prefix: The S3 prefix to use when looking for application artifacts.
+        allowed_key_patterns: Compiled S3 key patterns for application artifacts.
+
+    Returns:
+        A tuple containing the name of the application and its version, or
+        `None` if no suitable artifact was found.
+    """
+    application_name = application["name"]
+    artifact_tag_filters = application.get("tag_filters", [])
+    prefix = f"{s3_prefix + '/' if s3_prefix else ''}{application_name}/"
+    paginator = s3.get_paginator("list_objects_v2")
+    object_count = 0
+    valid_objects = []
+    # Filter each page as it arrives, so that only the valid objects are kept
+    for page in paginator.paginate(
+        Bucket=bucket_name,
+        Prefix=prefix,
+        PaginationConfig={"PageSize": 1000},
+    ):
+        objects = page.get("Contents", [])
+        object_count += len(objects)
+        valid_objects.extend(
+            obj
+            for obj in objects
+            if any(
+                pattern.search(obj["Key"]) for pattern in allowed_key_patterns
+            )
+        )
+    if object_count == 0:
+        logger.info(
+            "Did not find any objects in bucket '%s' matching the prefix '%s'",
+            bucket_name,
+            prefix,
+        )
+        return None
+
+    logger.info(
+        "Found a total of %s objects under prefix '%s'",
+        object_count,
+        f"{bucket_name}/{prefix}",
+    )
+    logger.info(
+        "Found %s valid objects under prefix '%s' %s",
+        len(valid_objects),
+        f"{bucket_name}/{prefix}",
+        valid_objects,
+    )
+    if len(valid_objects) and len(artifact_tag_filters) == 0:
+        # The SHA1 can be read from the key of the most recent artifact, so
+        # there is no need to look up its metadata
+        obj = max(valid_objects, key=lambda obj: obj["LastModified"])
+        version = get_version_from_key(obj["Key"], allowed_key_patterns)
+        if version:
+            return (
+                application_name,
+                {
+                    "version": version,
+                    "location": bucket_name,
+                    "path": obj["Key"].rsplit("/", 1)[0],
+                },
+            )
+    # Fetch metadata for a few of the most recent objects at a time, and stop
+    # as soon as one of them has a matching set of tags. The objects are kept
+    # in a heap, as usually only the first few of them are needed.
+    heap = [
+        (-obj["LastModified"].timestamp(), i, obj)
+        for i, obj in enumerate(valid_objects)
+    ]
+    heapq.heapify(heap)
+    batch_size = 1
+    while len(heap):
+        batch = [
+            heapq.heappop(heap)[2] for _ in range(min(batch_size, len(heap)))
+        ]
+        batch_size = S3_METADATA_BATCH_SIZE
+        batch_responses = list(
+            _s3_metadata_executor.map(
+                lambda key: s3.head_object(Bucket=bucket_name, Key=key),
+                [obj["Key"] for obj in batch],
+            )
+        )
+        for obj, response in zip(batch, batch_responses):
+            metadata = response["Metadata"]
+            logger.info(
+                "Object with key '%s' has metadata '%s'",
+                obj["Key"],
+                metadata,
+            )
+            version = get_version_from_metadata(metadata, artifact_tag_filters)
+            if version:
+                return (
+                    application_name,
+                    {
+                        "version": version,
+                        "location": bucket_name,
+                        "path": obj["Key"].rsplit("/", 1)[0],
+                    },
+                )
+    return None
+
+
 def get_s3_artifact_versions(
     applications,
     bucket_name,
     s3_prefix,
-    allowed_key_patterns=[r"[a-z0-9]{7}\.(zip|jar)$"],
+    allowed_key_patterns=[r"/(?P<sha1>[a-z0-9]{7,})\.(zip|jar)$"],
 ):
     """Gets the S3 version of application artifacts stored under a given S3 prefix.
 
@@ -201,103 +581,104 @@ def get_s3_artifact_versions(
         bucket_name: The name of the S3 bucket to use when looking for application artifacts.
         s3_prefix: The S3 prefix to use when looking for application artifacts
             (e.g., `nsbno/trafficinfo-aws/lambdas`).
-        allowed_key_patterns: Allowed S3 key patterns for application artifacts.
+        allowed_key_patterns: Allowed S3 key patterns for application artifacts,
+            either as strings or as compiled patterns.
 
     Returns:
         A dictionary containing the application names together with the
         SHA1 of the latest artifact.
     """
-    s3 = boto3.client("s3")
-    s3_resource = boto3.resource("s3")
+    s3 = get_client("s3")
+    compiled_key_patterns = [
+        re.compile(pattern) for pattern in allowed_key_patterns
+    ]
     versions = {}
 
-    for application in applications:
-        application_name = application["name"]
-        artifact_tag_filters = application.get("tag_filters", [])
-        prefix = f"{s3_prefix + '/' if s3_prefix else ''}{application_name}/"
-        response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-        try:
-            objects = response["Contents"]
-        except KeyError:
-            logger.info(
-                "Did not find any objects in bucket '%s' matching the prefix '%s'",
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(32, len(applications)))
+    ) as executor:
+        futures = [
+            executor.submit(
+                get_s3_artifact_version,
+                s3,
+                application,
                 bucket_name,
-                prefix,
+                s3_prefix,
+                compiled_key_patterns,
             )
-            continue
+            for application in applications
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            if result is not None:
+                application_name, version = result
+                versions[application_name] = version
+
+    logger.info("Found versions '%s'", versions)
+    return versions
 
-        while response["IsTruncated"]:
-            response = s3.list_objects_v2(
-                Bucket=bucket_name,
-                ContinuationToken=response["NextContinuationToken"],
-                Prefix=prefix,
+
+def get_parameter_values(ssm, names):
+    """Gets the current values of a list of parameters in parameter store.
+
+    Args:
+        ssm: The SSM client to use.
+        names: The names of the parameters.
+
+    Returns:
+        A dictionary containing the names of the parameters that exist
+        together with their value. The dictionary is empty if the client is
+        not allowed to read the parameters.
+    """
+    values = {}
+    for i in range(0, len(names), SSM_GET_PARAMETERS_BATCH_SIZE):
+        try:
+            response = ssm.get_parameters(
+                Names=names[i : i + SSM_GET_PARAMETERS_BATCH_SIZE]
             )
-            objects = objects + response["Contents"]
-        logger.info(
-            "Found a total of %s objects under prefix '%s' %s",
-            len(objects),
-            f"{bucket_name}/{prefix}",
-            objects,
-        )
-        valid_objects = list(
-            filter(
-                lambda obj: any(
-                    re.search(pattern, obj["Key"])
-                    for pattern in allowed_key_patterns
-                ),
-                objects,
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] != "AccessDeniedException":
+                raise
+            logger.warn(
+                "Not allowed to read the current values of the parameters, so all parameters will be written"
             )
-        )
-        logger.info(
-            "Found %s valid objects under prefix '%s' %s",
-            len(valid_objects),
-            f"{bucket_name}/{prefix}",
-            valid_objects,
-        )
-        sorted_objects = sorted(
-            valid_objects,
-            key=lambda obj: obj["LastModified"].timestamp(),
-            reverse=True,
-        )
-        if len(sorted_objects):
-            for obj in sorted_objects:
-                metadata = s3_resource.Object(bucket_name, obj["Key"]).metadata
-                logger.info(
-                    "Object with key '%s' has metadata '%s'",
-                    obj["Key"],
-                    metadata,
-                )
-                tags = (
-                    json.loads(metadata["tags"])
-                    if metadata.get("tags", None)
-                    else None
-                )
-                if (
-                    tags
-                    and any(tag.endswith("-SHA1") for tag in tags)
-                    and all(tag in tags for tag in artifact_tag_filters)
-                ):
-                    version = next(
-                        (
-                            tag.split("-SHA1")[0]
-                            for tag in tags
-                            if tag.endswith("-SHA1")
-                        ),
-                        None,
-                    )
-                    if version:
-                        versions[application_name] = {
-                            "version": version,
-                            "location": bucket_name,
-                            "path": obj["Key"].rsplit("/", 1)[0],
-                        }
-                        break
+            return {}
+        for parameter in response["Parameters"]:
+            values[parameter["Name"]] = parameter["Value"]
+    return values
 
-    logger.info("Found versions '%s'", versions)
-    return versions
+
+def get_ssm_client(region, account_id="", account_role=""):
+    """Gets an SSM client, optionally using the credentials of an assumed role.
+
+    The client is kept across warm invocations of the Lambda.
+
+    Args:
+        region: The region to use when creating the SSM client.
+        account_id: The id of the account that owns the role `account_role`.
+        account_role: The name of the role to assume. If either this or
+            `account_id` is empty, the execution role of the Lambda is used.
+
+    Returns:
+        An SSM client.
+    """
+    key = (account_id, account_role, region)
+    if key not in _ssm_clients:
+        config = CLIENT_CONFIGS["ssm"]
+        if account_id and account_role:
+            session = get_assumed_role_session(account_id, account_role)
+            _ssm_clients[key] = session.client(
+                "ssm", region_name=region, config=config
+            )
+        else:
+            with _clients_lock:
+                _ssm_clients[key] = boto3.client(
+                    "ssm", region_name=region, config=config
+                )
+    return _ssm_clients[key]
 
 
-def set_ssm_parameters(credentials, versions, ssm_prefix, region):
+def set_ssm_parameters(ssm, versions, ssm_prefix):
     """Updates (or creates) one parameter in parameter store for each
     pair of application and version passed in.
 
@@ -306,26 +687,45 @@ def set_ssm_parameters(credentials, versions, ssm_prefix, region):
         `{"trafficinfo-docker-app": "acdefgh"}`
 
     Args:
-        credentials: The credentials to use when creating the SSM client.
+        ssm: The SSM client to use.
         versions: A dictionary containing the names of applications
             as well as their version.
         ssm_prefix: The prefix to use for the parameters in parameter store
             (e.g., `trafficinfo`).
-        region: The region to use when creating the SSM client.
     """
     if len(ssm_prefix) == 0 or ssm_prefix.lower().startswith("aws"):
         logger.error("SSM prefix '%s' is not valid", ssm_prefix)
         raise ValueError()
 
+    parameters = {}
     for application, version in versions.items():
         ssm_name = f"/{ssm_prefix}/{application}"
 
         for key, value in version.items():
             if key == "version":
                 # This is to support backwards compatability!
-                update_parameterstore(credentials, ssm_name, value, region)
+                parameters[ssm_name] = value
             else:
-                update_parameterstore(credentials, f"{ssm_name}/{key}", value, region)
+                parameters[f"{ssm_name}/{key}"] = value
+
+    # Only write parameters that are missing or have a different value
+    existing_parameters = get_parameter_values(ssm, list(parameters))
+    for name, value in list(parameters.items()):
+        if existing_parameters.get(name) == value:
+            logger.info(
+                "SSM parameter '%s' is already set to '%s'", name, value
+            )
+            del parameters[name]
+
+    # Throttling by the PutParameter quota is handled by the adaptive retry
+    # mode of the SSM client, which also limits the rate of later requests
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [
+            executor.submit(update_parameterstore, ssm, name, value)
+            for name, value in parameters.items()
+        ]
+        for future in as_completed(futures):
+            future.result()
 
 
 def lambda_handler(event, context):
@@ -365,41 +765,66 @@ def lambda_handler(event, context):
     frontend_versions = versions.get("frontend", {})
     lambda_versions = versions.get("lambda", {})
 
-    if get_versions and lambda_s3_bucket and len(lambda_applications):
-        lambda_versions = get_s3_artifact_versions(
-            lambda_applications,
-            lambda_s3_bucket,
-            lambda_s3_prefix,
-            [r"/[a-z0-9]{7,}\.(zip|jar)$"],
+    # The artifact stores are independent of each other, so they are searched
+    # concurrently
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        lambda_future = (
+            executor.submit(
+                get_s3_artifact_versions,
+                lambda_applications,
+                lambda_s3_bucket,
+                lambda_s3_prefix,
+                LAMBDA_KEY_PATTERNS,
+            )
+            if get_versions and lambda_s3_bucket and len(lambda_applications)
+            else None
         )
-
-    if get_versions and frontend_s3_bucket and len(frontend_applications):
-        frontend_versions = get_s3_artifact_versions(
-            frontend_applications,
-            frontend_s3_bucket,
-            frontend_s3_prefix,
-            [r"/[a-z0-9]{7,}\.zip$"],
+        frontend_future = (
+            executor.submit(
+                get_s3_artifact_versions,
+                frontend_applications,
+                frontend_s3_bucket,
+                frontend_s3_prefix,
+                FRONTEND_KEY_PATTERNS,
+            )
+            if get_versions
+            and frontend_s3_bucket
+            and len(frontend_applications)
+            else None
         )
-
-    if get_versions and len(ecr_applications):
-        ecr_versions = get_ecr_versions(ecr_applications)
-
-    if set_versions:
-        if len(
-            set().union(ecr_versions, frontend_versions, lambda_versions)
-        ) != len(ecr_versions) + len(frontend_versions) + len(lambda_versions):
+        ecr_future = (
+            executor.submit(get_ecr_versions, ecr_applications)
+            if get_versions and len(ecr_applications)
+            else None
+        )
+        if lambda_future:
+            lambda_versions = lambda_future.result()
+        if frontend_future:
+            frontend_versions = frontend_future.result()
+        if ecr_future:
+            ecr_versions = ecr_future.result()
+
+    if set_versions and (ecr_versions or frontend_versions or lambda_versions):
+        ecr_names = ecr_versions.keys()
+        frontend_names = frontend_versions.keys()
+        lambda_names = lambda_versions.keys()
+        if (
+            ecr_names & frontend_names
+            or ecr_names & lambda_names
+            or frontend_names & lambda_names
+        ):
             logger.error(
                 "One or more ECR, Lambda and/or frontend applications are sharing the same name"
             )
             raise ValueError()
-        credentials = (
-            assume_role(account_id, role_to_assume)
-            if account_id and role_to_assume
-            else None
+        # The SSM client (which may have to assume a role) is only created
+        # once there are versions to set
+        ssm = get_ssm_client(region, account_id, role_to_assume)
+        set_ssm_parameters(
+            ssm,
+            {**lambda_versions, **frontend_versions, **ecr_versions},
+            ssm_prefix,
         )
-        set_ssm_parameters(credentials, lambda_versions, ssm_prefix, region)
-        set_ssm_parameters(credentials, frontend_versions, ssm_prefix, region)
-        set_ssm_parameters(credentials, ecr_versions, ssm_prefix, region)
 
     return {
         "ecr": ecr_versions,